@@ -8,12 +8,20 @@ Created on Sat Jul 18 14:10:55 2015
 
 # Import necessary modules
 import pygame
+import os
 import sys
 import copy
+import heapq
 import math
 import random
 import time
+import threading
+import multiprocessing
 import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
 
 
 # Program Structure
@@ -44,7 +52,110 @@ MOVE_STRATEGY[1] - DFS without Trimming
 """
 MOVE_STRATEGY = [0.85, 0.75, 0.25] # Percent of emtpy spaces remaining 
 NTRIALS = [1000,2000]
+MC_HEAVY = False # Use the heavy playout policy (win, block, avoid) in Monte Carlo
+MC_BATCH = 25 # Monte Carlo trials scored together in one array update
+
+"""
+Parallel exact search settings. If SOLVER_WORKERS is greater than zero, the DFS
+stages use board_move_parallel with that many worker processes, sharing a
+transposition table of TT_ENTRIES entries (16 bytes each) in shared memory.
+"""
+SOLVER_WORKERS = 0
+TT_ENTRIES = 1 << 20
+
+"""
+Endgame database settings. Positions with at most ENDGAME_EMPTY empty spaces
+are looked up in the database at ENDGAME_DB_PATH (see build_endgame_db), 
+memory-mapped the first time it is needed.
+"""
+ENDGAME_EMPTY = 14
+ENDGAME_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'endgame.npy')
+ENDGAME_DB = None
+
+"""
+Image settings. The chip stack and button images are loaded from IMAGE_DIR
+(see load_assets), ASSET_FILES giving the file and scaled size of each.
+Headless rendering (see render_games) uses RENDER_WORKERS processes (0 for
+one per CPU) and moves falling chips by DROP_STEP pixels per animation frame.
+"""
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'images')
+ASSET_FILES = {'red_chip_stack' : ('chips.jpg', (125,75)),
+               'blue_chip_stack' : ('chips2.jpg', (125,75)),
+               'start_b' : ('Start_Button.jpg', (100,60)),
+               'stop_b' : ('Stop_Button.jpg', (100,60))}
+RENDER_WORKERS = 0
+DROP_STEP = 15
+RENDER_CACHE = None
+
+# Profiling phases, found by the outermost function of each phase in a sampled stack
+PROFILE_PHASES = {'solve_queue' : 'build',
+                  'board_move_MC_iter' : 'MC',
+                  'board_move_DFS' : 'DFS',
+                  'board_move_PN' : 'PN',
+                  'board_move_eval' : 'eval',
+                  'board_move_parallel' : 'parallel',
+                  'board_move_endgame' : 'endgame'}
+# Profiling operations, found by the innermost matching function
+PROFILE_OPERATIONS = {'clone' : 'clone',
+                      'check_win' : 'check_win'}
 MOVE_TIME = 15
+PN_NODES = 5000 # Node budget of the proof-number search run before MC and trimmed DFS
+
+"""
+Step sizes of get_move_anytime, which yields a move after each step
+
+ANYTIME_EVAL_DEPTH - Deepest evaluation search used for the first quick estimates
+ANYTIME_STEP - Monte Carlo trials per step
+ANYTIME_SLICE - Seconds of DFS per step
+"""
+ANYTIME_EVAL_DEPTH = 4
+ANYTIME_STEP = 100
+ANYTIME_SLICE = 0.25
+
+"""
+Background solver settings, used to predict which positions to solve with the
+spare move time (see BackgroundSolver)
+
+SCHEDULER_DEPTH - Moves ahead of the selected move to predict
+SCHEDULER_WIDTH - Most likely opponent replies to follow further down the line
+"""
+SCHEDULER_DEPTH = 4
+SCHEDULER_WIDTH = 2
+
+"""
+Static evaluation settings. If EVAL_DEPTH is greater than zero, the Monte Carlo
+stages are replaced by a depth-limited search (board_move_eval) whose leaves are
+scored in a single batched call to evaluate_boards.
+
+EVAL_WEIGHTS - Weights of [open twos, open threes, threat parity, center control]
+EVAL_MLP - Optional (W1, b1, W2, b2) model used instead of the linear weights
+"""
+EVAL_DEPTH = 0
+EVAL_WEIGHTS = np.array([0.05, 0.2, 0.3, 0.01])
+EVAL_MLP = None
+
+"""
+Difficulty levels defined by node and playout budgets instead of seconds, so a
+level plays the same position the same way on any machine. Level moves search
+with their own dictionaries and random generators (see get_level_move), so
+they don't depend on earlier moves either, and skip the endgame database, 
+which differs between machines. A level of None uses the time based settings
+above.
+
+ntrials - Monte Carlo playouts for the MOVE_STRATEGY[0] and [1] stages
+eval_depth - Depth of board_move_eval used instead of Monte Carlo (0 = off)
+pn_nodes - Node budget for the proof-number search (0 = skip)
+dfs_nodes - Node budget for the DFS stages (0 = skip DFS)
+"""
+DIFFICULTY = {'Easy' : {'ntrials' : [0, 0], 'eval_depth' : 1, 'pn_nodes' : 0,
+                        'dfs_nodes' : 0},
+              'Medium' : {'ntrials' : [0, 0], 'eval_depth' : 4, 'pn_nodes' : 0,
+                          'dfs_nodes' : 0},
+              'Hard' : {'ntrials' : [1000, 2000], 'eval_depth' : 0, 'pn_nodes' : 2000,
+                        'dfs_nodes' : 5000},
+              'Expert' : None}
+DIFFICULTY_ORDER = ['Easy', 'Medium', 'Hard', 'Expert']
+LEVEL = 'Expert'
 #==============================================================================
 # Grid str representation dictionary
 CHIP_LETTER = {'WHITE' : 'E',
@@ -74,6 +185,41 @@ encrypt = {0: 'WHITE',
           1: PLAYER_1,
           -1: PLAYER_2}
 
+# Chip values for the array representation of the grid (inverse of encrypt)
+CHIP_VALUE = {'WHITE' : 0,
+              PLAYER_1 : 1,
+              PLAYER_2 : -1}
+
+# Winning lines as lists of [col, row] indices (69 lines on a 7x6 board)
+WIN_LINES = [[[col + DIR[d][0]*step, row + DIR[d][1]*step] for step in range(WIN_LENGTH)]
+             for col in range(NUM_CHIP_WIDE) for row in range(NUM_CHIP_HIGH) for d in sorted(DIR)
+             if 0 <= col + DIR[d][0]*(WIN_LENGTH-1) < NUM_CHIP_WIDE
+             and 0 <= row + DIR[d][1]*(WIN_LENGTH-1) < NUM_CHIP_HIGH]
+
+# Winning lines passing through each cell, called by CELL_WIN_LINES[col][row]
+CELL_WIN_LINES = [[[line for line in WIN_LINES if [col, row] in line] 
+                   for row in range(NUM_CHIP_HIGH)] for col in range(NUM_CHIP_WIDE)]
+
+# Flat (col*NUM_CHIP_HIGH + row) indices of the winning lines, number of lines
+# through each cell and whether a cell sits on an odd row counting from the bottom
+WIN_LINE_IDX = np.array([[cell[0]*NUM_CHIP_HIGH + cell[1] for cell in line] for line in WIN_LINES])
+CELL_LINE_COUNT = np.bincount(WIN_LINE_IDX.ravel(), minlength=NUM_CHIP_WIDE*NUM_CHIP_HIGH)
+# Bitboard layout for the exact solver: bit (col*(NUM_CHIP_HIGH+1) + height) with
+# height counted from the bottom, plus one spare bit on top of each column
+BOARD_CELLS = NUM_CHIP_WIDE*NUM_CHIP_HIGH
+COLUMN_BITS = NUM_CHIP_HIGH + 1
+BOTTOM_BIT = [1 << (col*COLUMN_BITS) for col in range(NUM_CHIP_WIDE)]
+TOP_BIT = [1 << (col*COLUMN_BITS + NUM_CHIP_HIGH - 1) for col in range(NUM_CHIP_WIDE)]
+COLUMN_MASK = [((1 << NUM_CHIP_HIGH) - 1) << (col*COLUMN_BITS) for col in range(NUM_CHIP_WIDE)]
+
+# Transposition table entry flags
+TT_EXACT = 1
+TT_LOWER = 2
+TT_UPPER = 3
+
+ODD_ROW = np.array([(NUM_CHIP_HIGH - row) % 2 == 1 for col in range(NUM_CHIP_WIDE)
+                    for row in range(NUM_CHIP_HIGH)])
+
 # Grid state tracking dictionaries for computer moves
 P1_grid_states = {}     
 P2_grid_states = {}
@@ -87,11 +233,20 @@ def grid_reset():
     """
     Reset grid state dictionaries for tracking optimal moves based on grid states
     """
-    global P1_grid_states, P2_grid_states
+    global P1_grid_states, P2_grid_states, P1_trim_grid_state, P2_trim_grid_state
     P1_grid_states = {}
     P2_grid_states = {}
     P1_trim_grid_state = {}
     P2_trim_grid_state = {}
+    BACKGROUND_SOLVER.reset()
+
+def get_grid_tables():
+    """
+    Returns the global grid state dictionaries by player, each as a tuple
+    (full DFS dictionary, trimmed DFS dictionary)
+    """
+    return {PLAYER_1 : (P1_grid_states, P1_trim_grid_state),
+            PLAYER_2 : (P2_grid_states, P2_trim_grid_state)}
 
 def set_first_turn(player):
     """
@@ -106,6 +261,22 @@ def set_opponent(opponent):
     """
     global BRAIN
     BRAIN[PLAYER_2] = opponent
+
+def set_difficulty(level):
+    """
+    Function to change the difficulty level of the computer (see DIFFICULTY)
+    """
+    global LEVEL
+    LEVEL = level
+    
+def within_budget(start_time, time_check, budget):
+    """
+    Helper function which checks that a search started at start_time is still
+    within its time limit and, if given, its SearchBudget.
+    """
+    if (time.time() - start_time) >= time_check:
+        return False
+    return budget == None or not budget.expired()
     
 def idx_to_pos(idx):
     """
@@ -118,6 +289,58 @@ def idx_to_pos(idx):
     (CHIP_DIAMETER + CHIP_SPACING)*idx[1])
     return (x_pos, y_pos)
 
+def get_grid_moves(grid):
+    """
+    Helper function which returns the available [col, row] moves of a grid list
+    (grid[column][row]) without needing a GameBoard.
+    """
+    avail_moves = []
+    for col_idx in range(len(grid)):
+        column = grid[col_idx]
+        if column[0] == 'WHITE':
+            row_idx = len(column) - 1
+            while column[row_idx] != 'WHITE':
+                row_idx -= 1
+            avail_moves.append([col_idx, row_idx])
+    return avail_moves
+
+def is_winning_move(grid, idx, player):
+    """
+    Helper function which checks, after a chip of player was placed at idx, if 
+    any of the winning lines through idx is complete.
+    """
+    for line in CELL_WIN_LINES[idx[0]][idx[1]]:
+        for cell in line:
+            if grid[cell[0]][cell[1]] != player:
+                break
+        else:
+            return True
+    return False
+
+def is_threat(grid, idx, player):
+    """
+    Helper function which checks if a chip of player placed at the (empty) idx 
+    would complete one of the winning lines through idx.
+    """
+    for line in CELL_WIN_LINES[idx[0]][idx[1]]:
+        for cell in line:
+            if cell != idx and grid[cell[0]][cell[1]] != player:
+                break
+        else:
+            return True
+    return False
+
+def get_first_player(game_board, game_state):
+    """
+    Helper function which determines who moved first from the board: the
+    player with more chips, or with the same number and to move.
+    """
+    chip_count = (len(game_board.get_state_indices(PLAYER_1)) - 
+                  len(game_board.get_state_indices(PLAYER_2)))
+    if chip_count > 0 or (chip_count == 0 and game_state._player_turn == PLAYER_1):
+        return PLAYER_1
+    return PLAYER_2
+
 def mirror_move(move, board_width):
     """
     Takes a move (score, [col, row], trace), and returns the mirror opposite
@@ -151,141 +374,518 @@ def check_move():
 ##############################################################################
 # Computer Functions    
     
-def get_move(game_board, game_state, trace = 1):
+def get_move(game_board, game_state, trace = 1, tables = None, level = None, solver = None):
     """
     Function which evaluates the current full board and determines which
     sub-move function to call (Monte Carlo or Depth First Search). If time remains
-    for move, then computer will begin building a move dictionary
+    for move, then computer will solve the positions the background solver 
+    predicts next. The grid state dictionaries (see get_grid_tables), difficulty
+    level and background solver default to the globals. Runs get_move_anytime, 
+    which holds the stages, to the end and returns its final move.
+    """
+    for move, confidence in get_move_anytime(game_board, game_state, trace, tables, level, solver):
+        if confidence >= 1.0:
+            selected_move = move
+    return selected_move
+
+def get_move_anytime(game_board, game_state, trace = 1, tables = None, level = None, solver = None):
+    """
+    Generator which runs the stages of get_move and yields (move, confidence)
+    pairs as the search improves, so a caller can stop at any time and use the
+    latest move. Confidence is the share of the search that is done, reaching
+    1.0 once the move is final (proven or fully searched). Moves keep being 
+    yielded at 1.0 while the remaining MOVE_TIME solves predicted positions.
     """
+    if tables == None:
+        tables = get_grid_tables()
+    if level == None:
+        level = LEVEL
+    if solver == None:
+        solver = BACKGROUND_SOLVER
+    if DIFFICULTY[level] != None:
+        yield (get_level_move(game_board, game_state, level, trace), 1.0)
+        return
+    full_grid, trim_grid = tables[game_state._player_turn]
     empty_spaces = len(game_board.get_state_indices('WHITE'))
     total_spaces = NUM_CHIP_HIGH*NUM_CHIP_WIDE
     init_time = time.time()
-    if empty_spaces >= math.ceil(MOVE_STRATEGY[0] * total_spaces):
-        #print 'Monte Carlo Move Selected (',NTRIALS[0],'trials)'
-        selected_move = board_move_MC(game_board, game_state, NTRIALS[0])
-    elif empty_spaces >= math.ceil(MOVE_STRATEGY[1] * total_spaces):
-        #print 'Monte Carlo Move Selected (',NTRIALS[1],'trials)'
-        selected_move = board_move_MC(game_board, game_state, NTRIALS[1])
-    elif empty_spaces >= math.ceil(MOVE_STRATEGY[2] * total_spaces):
-        if game_state._player_turn == PLAYER_1:
-            #print 'Trimmed Depth First Search Move Selected'
-            selected_move = board_move_DFS(game_board, game_state, P1_trim_grid_state, True, trace, 20)
+    best_move = None
+    confidence = 0.0
+    selected_move = solver.lookup(game_board, game_state, trim_grid)
+    if selected_move == None and empty_spaces <= ENDGAME_EMPTY:
+        #print 'Endgame Database Move Selected'
+        selected_move = board_move_endgame(game_board, game_state, trace)
+    # Quick estimates from increasingly deep evaluation searches
+    if selected_move == None:
+        for depth in range(1, ANYTIME_EVAL_DEPTH + 1):
+            best_move = board_move_eval(game_board, game_state, depth)
+            confidence = 0.1 * depth / ANYTIME_EVAL_DEPTH
+            yield (best_move, confidence)
+    if selected_move == None and PN_NODES > 0 and empty_spaces >= math.ceil(MOVE_STRATEGY[2] * total_spaces):
+        #print 'Proof-Number Search Selected'
+        selected_move = board_move_PN(game_board, game_state, trim_grid, trace, PN_NODES)
+    if selected_move == None and empty_spaces < math.ceil(MOVE_STRATEGY[1] * total_spaces):
+        if empty_spaces >= math.ceil(MOVE_STRATEGY[2] * total_spaces):
+            grid, trim, time_limit = trim_grid, True, 20
         else:
-            #print 'Trimmed Depth First Search Move Selected'
-            selected_move = board_move_DFS(game_board, game_state, P2_trim_grid_state, True, trace, 20)
-    else:
-        if game_state._player_turn == PLAYER_1:
-            #print 'Full Depth First Search Move Selected'
-            selected_move = board_move_DFS(game_board, game_state, P1_grid_states, False, trace, 15)
+            grid, trim, time_limit = full_grid, False, 15
+        dfs_time = time.time()
+        if SOLVER_WORKERS > 0 and shared_memory != None:
+            #print 'Parallel Exact Search Move Selected'
+            for selected_move in board_move_parallel_iter(game_board, game_state, SOLVER_WORKERS, 
+                                                          time_limit, full_grid, trace):
+                if selected_move == None and best_move != None:
+                    confidence = 0.1 + 0.8 * (time.time() - dfs_time) / time_limit
+                    yield (best_move, confidence)
         else:
-            #print 'Full Depth First Search Move Selected'
-            selected_move = board_move_DFS(game_board, game_state, P2_grid_states, False, trace, 15)
+            # DFS in time slices, each one reusing the positions solved by the last
+            #print 'Depth First Search Move Selected (trimmed if trim)'
+            while selected_move == None and time.time() - dfs_time < time_limit:
+                slice_time = min(ANYTIME_SLICE, time_limit - (time.time() - dfs_time))
+                selected_move = board_move_DFS(game_board, game_state, grid, trim, trace, slice_time)
+                if selected_move == None:
+                    confidence = 0.1 + 0.8 * (time.time() - dfs_time) / time_limit
+                    if best_move != None:
+                        yield (best_move, confidence)
+    # Monte Carlo (or evaluation search) in steps of trials, also used when
+    # the exact search runs out of time
     if selected_move == None:
-        #print 'time expired, reverting to monte carlo'
-        selected_move = board_move_MC(game_board, game_state, NTRIALS[1])
+        if EVAL_DEPTH > 0 and empty_spaces >= math.ceil(MOVE_STRATEGY[1] * total_spaces):
+            #print 'Evaluation Search Move Selected (depth',EVAL_DEPTH,')'
+            selected_move = board_move_eval(game_board, game_state, EVAL_DEPTH)
+        else:
+            if empty_spaces >= math.ceil(MOVE_STRATEGY[0] * total_spaces):
+                ntrials = NTRIALS[0]
+            else:
+                ntrials = NTRIALS[1]
+            #print 'Monte Carlo Move Selected (',ntrials,'trials)'
+            base = confidence
+            for best_move, trials in board_move_MC_iter(game_board, game_state, ntrials, ANYTIME_STEP):
+                if trials < ntrials:
+                    yield (best_move, base + (1 - base) * trials / ntrials)
+            selected_move = best_move
+    yield (selected_move, 1.0)
+    # Use the remaining time to solve predicted positions, until none are left
+    #print 'Solving predicted positions'
+    solver.schedule(game_board, game_state, selected_move, trace)
     time_remaining = MOVE_TIME - (time.time() - init_time)
-    #print 'move time is', time_remaining
-    if time_remaining > 0:
-        if game_state._player_turn == PLAYER_1:
-            #print 'Building player 1 dictionary'
-            board_move_DFS(game_board, game_state, P1_trim_grid_state, True, trace, time_remaining)        
+    while time_remaining > 0:
+        if solver.solve_queue(trim_grid, SearchBudget(seconds = min(ANYTIME_SLICE, time_remaining))):
+            break
+        yield (selected_move, 1.0)
+        time_remaining = MOVE_TIME - (time.time() - init_time)
+
+def get_move_within(game_board, game_state, seconds, trace = 1, tables = None, level = None, solver = None):
+    """
+    Runs get_move_anytime until its move is final or the given seconds have 
+    passed (checked between steps) and returns the latest move.
+    """
+    start_time = time.time()
+    for best_move, confidence in get_move_anytime(game_board, game_state, trace, tables, level, solver):
+        if confidence >= 1.0 or time.time() - start_time >= seconds:
+            break
+    return best_move
+
+def get_level_move(game_board, game_state, level_name, trace = 1):
+    """
+    Version of get_move for a difficulty level. Every stage is limited by a
+    node or playout budget instead of time, searches with new dictionaries
+    and uses its own random generator seeded by the level, stage and board.
+    The move only depends on the level and position: neither the shared 
+    dictionaries, the endgame database nor the global random state are used.
+    """
+    level = DIFFICULTY[level_name]
+    empty_spaces = len(game_board.get_state_indices('WHITE'))
+    total_spaces = NUM_CHIP_HIGH*NUM_CHIP_WIDE
+    full_grid, trim_grid = {}, {}
+    selected_move = None
+    if level['pn_nodes'] > 0 and empty_spaces >= math.ceil(MOVE_STRATEGY[2] * total_spaces):
+        selected_move = board_move_PN(game_board, game_state, trim_grid, trace, level['pn_nodes'])
+    if selected_move == None and level['dfs_nodes'] > 0 and empty_spaces < math.ceil(MOVE_STRATEGY[1] * total_spaces):
+        budget = SearchBudget(nodes = level['dfs_nodes'])
+        rng = random.Random(level_name + 'DFS' + str(game_board._grid))
+        if empty_spaces >= math.ceil(MOVE_STRATEGY[2] * total_spaces):
+            selected_move = board_move_DFS(game_board, game_state, trim_grid, True, trace, 
+                                           budget = budget, rng = rng)
+        else:
+            selected_move = board_move_DFS(game_board, game_state, full_grid, False, trace, 
+                                           budget = budget, rng = rng)
+    if selected_move == None:
+        rng = random.Random(level_name + 'MC' + str(game_board._grid))
+        if level['eval_depth'] > 0:
+            selected_move = board_move_eval(game_board, game_state, level['eval_depth'])
+        elif empty_spaces >= math.ceil(MOVE_STRATEGY[0] * total_spaces):
+            selected_move = board_move_MC(game_board, game_state, level['ntrials'][0], rng = rng)
         else:
-            #print 'Building player 2 dictionary'
-            board_move_DFS(game_board, game_state, P2_trim_grid_state, True, trace, time_remaining)
+            selected_move = board_move_MC(game_board, game_state, level['ntrials'][1], rng = rng)
     return selected_move
 
 
+def random_position(empty_spaces):
+    """
+    Plays random moves from an empty board until empty_spaces remain or the
+    game is over, and returns the (GameBoard, GameState).
+    """
+    game_board = GameBoard(NUM_CHIP_WIDE, NUM_CHIP_HIGH, WIN_LENGTH)
+    game_state = GameState(PLAYER_1)
+    game_state.start_game()
+    while len(game_board.get_state_indices('WHITE')) > empty_spaces and game_state._winner == None:
+        game_board.quick_add(random.choice(game_board.get_available_moves()), game_state._player_turn)
+        game_board.check_win(game_state)
+        game_state.switch_turn()
+    return (game_board, game_state)
+
 def get_translate_move(array_board):
     """
     Function which takes an array board format and returns the move to make for
     playing against tom's AI.
     """
-    temp_grid = [['WHITE' for row_idx in range(6)] for col_idx in range(7)] 
-    for row_idx in range(6):
-        for col_idx in range(7):
-            temp_grid[col_idx][row_idx] = encrypt[array_board[row_idx][col_idx]]
-    temp_board = GameBoard(7, 6, 4, grid = temp_grid)
+    temp_board = array_to_board(array_board)
     temp_state = GameState()
     temp_state._player_turn = PLAYER_2
     temp_state._game_over = False
     move = get_move(temp_board, temp_state)
     return move[1][0]
 
+def array_to_board(array_board):
+    """
+    Converts an array board format (array_board[row][column] of 1, -1 and 0)
+    into a GameBoard
+    """
+    temp_grid = [['WHITE' for row_idx in range(6)] for col_idx in range(7)] 
+    for row_idx in range(6):
+        for col_idx in range(7):
+            temp_grid[col_idx][row_idx] = encrypt[array_board[row_idx][col_idx]]
+    return GameBoard(7, 6, 4, grid = temp_grid)
+
+def load_position(path):
+    """
+    Loads a position from a text file holding either an array board (6 lines
+    of 7 values, as used by get_translate_move) or a game log (the columns 
+    played, in order, starting with PLAYER_1). For an array board the player
+    with fewer chips is to move, PLAYER_2 on a tie as in get_translate_move.
+    A game log with a move off the board, into a full column or after the 
+    end of the game raises a ValueError.
+    
+    Returns a tuple (GameBoard, GameState).
+    """
+    with open(path) as log_file:
+        lines = [line.replace(',', ' ').split() for line in log_file if line.strip()]
+    game_state = GameState(PLAYER_1)
+    game_state.start_game()
+    if len(lines) == NUM_CHIP_HIGH and all(len(line) == NUM_CHIP_WIDE for line in lines):
+        game_board = array_to_board([[int(value) for value in line] for line in lines])
+        if len(game_board.get_state_indices(PLAYER_1)) < len(game_board.get_state_indices(PLAYER_2)):
+            game_state._player_turn = PLAYER_1
+        else:
+            game_state._player_turn = PLAYER_2
+    else:
+        game_board = GameBoard(NUM_CHIP_WIDE, NUM_CHIP_HIGH, WIN_LENGTH)
+        for column in [int(value) for line in lines for value in line]:
+            row = None
+            if 0 <= column < NUM_CHIP_WIDE:
+                row = game_board.get_empty_slot(column)
+            if game_state._game_over or row == None:
+                raise ValueError('Illegal move in column %s of %s' % (column, path))
+            game_board.quick_add([column, row], game_state._player_turn)
+            game_board.check_win(game_state)
+            game_state.switch_turn()
+    return (game_board, game_state)
+
 
 #==============================================================================
 # Monte Carlo (MC) Approach
 
-def board_move_MC(game_board, game_state, ntrials):
+def board_move_MC(game_board, game_state, ntrials, heavy = None, rng = None):
     """
     Perform a Monte Carlo on the current board and return the available move
-    with the best score.
+    with the best score. Playouts use the heavy policy if heavy (default MC_HEAVY)
+    and draw their moves from rng (default the random module).
     """
-    # Initialize score tracking and player turns
-    score_track = {}
-    for col in range(NUM_CHIP_WIDE):
-        for row in range(NUM_CHIP_HIGH):
-            score_track[(col,row)] = 0
-    current_player = game_state._player_turn
-    opponent = game_state.get_opponent()
-    # Iterate through the number of trials tracking the score for each space
-    for iteration in range(ntrials):
-        cloned_board = game_board.clone()
-        cloned_state = game_state.clone()
-        MC_playout(cloned_board, cloned_state, score_track)
-        result = cloned_board.check_win(cloned_state)
-        if result != 'DRAW':
-            MC_update_score(score_track, cloned_board, result, current_player, opponent)
-    # With all the grid spaces score, select the available move with highest score
-    max_score = -float('inf')
-    for move in game_board.get_available_moves():
-        if score_track[tuple(move)] > max_score:
-            max_score = score_track[tuple(move)]
-            best_move = move
-    return (max_score, best_move)
-
-def MC_playout(game_board, game_state, scores):
+    for best_move, trials in board_move_MC_iter(game_board, game_state, ntrials, ntrials, heavy, rng):
+        pass
+    return best_move
+
+def board_move_MC_iter(game_board, game_state, ntrials, step, heavy = None, rng = None):
+    """
+    Generator which performs the Monte Carlo trials in steps, yielding the
+    best move so far and the number of trials done after each step.
+    """
+    if heavy == None:
+        heavy = MC_HEAVY
+    if rng == None:
+        rng = random
+    # Initialize score tracking array, called by score_track[column][row]
+    score_track = np.zeros((NUM_CHIP_WIDE, NUM_CHIP_HIGH), dtype = int)
+    start_array = game_board.to_array()
+    # Iterate through the number of trials tracking the score for each space,
+    # scoring the finished boards of each batch in a single update
+    trials = 0
+    while True:
+        step_trials = min(step, ntrials - trials)
+        for batch_start in range(0, step_trials, MC_BATCH):
+            batch = min(MC_BATCH, step_trials - batch_start)
+            weights = score_track.tolist()
+            # Each trial's row starts from the current board and the playout
+            # scatters its moves into it
+            boards = np.empty((batch, NUM_CHIP_WIDE, NUM_CHIP_HIGH), dtype = np.int8)
+            boards[:] = start_array
+            winners = []
+            for iteration in range(batch):
+                cloned_board = game_board.clone()
+                cloned_state = game_state.clone()
+                MC_playout(cloned_board, cloned_state, weights, heavy, rng, boards[iteration])
+                winners.append(cloned_board.check_win(cloned_state))
+            MC_update_score(score_track, boards, winners)
+        trials += step_trials
+        # With all the grid spaces score, select the available move with highest score
+        max_score = -float('inf')
+        for move in game_board.get_available_moves():
+            if score_track[move[0], move[1]] > max_score:
+                max_score = int(score_track[move[0], move[1]])
+                best_move = move
+        yield ((max_score, best_move), trials)
+        if trials >= ntrials:
+            break
+
+def MC_playout(game_board, game_state, scores, heavy = False, rng = random, array = None):
     """
     Function which plays out a game board with proportional-random moves 
-    until the game is over.
+    drawn from rng until the game is over, optionally narrowed by the heavy
+    policy. Scores are called by scores[column][row]. If given, the CHIP_VALUE
+    of each move is also written into array[column][row].
     """
     while game_state._winner == None:
         temp_player = game_state._player_turn
         avail_moves = game_board.get_available_moves()
+        if heavy:
+            avail_moves = MC_heavy_moves(game_board._grid, avail_moves, temp_player, 
+                                         game_state.get_opponent())
         # Adjust probabilities of 'random' move selection based on score performance
         for move in avail_moves[:]:
-            if scores[tuple(move)] > 0:
-                for count in range(scores[tuple(move)]):
+            if scores[move[0]][move[1]] > 0:
+                for count in range(scores[move[0]][move[1]]):
                     avail_moves.append(move)
-        selected_move = random.choice(avail_moves)
+        selected_move = rng.choice(avail_moves)
         game_board.quick_add(selected_move, temp_player)
+        if array is not None:
+            array[selected_move[0], selected_move[1]] = CHIP_VALUE[temp_player]
         game_board.check_win(game_state)
         game_state.switch_turn()
         
-def MC_update_score(scores, game_board, winner, current_player, opponent):
-    """
-    Scores a finished game board and updates score tracking accordingly for 
-    each space
-    """
-    moves = scores.keys()
-    for move in moves:
-        if current_player == winner:
-            if game_board._grid[move[0]][move[1]] == current_player:
-                scores[move] += 1
-            elif game_board._grid[move[0]][move[1]] == opponent:
-                scores[move] -= 1
+def MC_heavy_moves(grid, avail_moves, player, opponent):
+    """
+    Heavy playout policy which narrows the available moves to a winning move if
+    there is one, otherwise to the moves blocking an immediate opponent win,
+    otherwise to the moves which don't let the opponent win directly above.
+    """
+    for move in avail_moves:
+        if is_threat(grid, move, player):
+            return [move]
+    blocks = [move for move in avail_moves if is_threat(grid, move, opponent)]
+    if blocks:
+        return blocks
+    safe_moves = [move for move in avail_moves if move[1] == 0 or 
+                  not is_threat(grid, [move[0], move[1] - 1], opponent)]
+    if safe_moves:
+        return safe_moves
+    return avail_moves
+
+def MC_update_score(scores, boards, winners):
+    """
+    Scores a batch of finished game boards (chip value arrays, called by 
+    boards[trial][column][row]) and updates the score array in one operation.
+    From the point of view of the player the scores belong to, each space gains
+    1 if it holds a chip of the winner and loses 1 if it holds a chip of the
+    loser, which is the board itself multiplied by the winner's score.
+    """
+    outcomes = np.array([SCORES[winner] for winner in winners])
+    scores += np.tensordot(outcomes, boards, axes = 1)
+
+def benchmark_playouts(npositions = 20, ntrials_list = [100, 300, 1000], seed = 0):
+    """
+    Compares the light and heavy playout policies on random positions with 12
+    empty spaces. For each policy and number of trials, prints the playouts per
+    second and the share of positions where Monte Carlo picked a move with the
+    best exact (full DFS) outcome. Positions where every move has the same 
+    outcome are skipped.
+    """
+    random.seed(seed)
+    positions = []
+    solved = {}
+    while len(positions) < npositions:
+        game_board, game_state = random_position(12)
+        if game_state._winner != None:
+            continue
+        # Exact outcome of each move for the player to move
+        outcomes = {}
+        for move in game_board.get_available_moves():
+            cloned_board = game_board.clone()
+            cloned_state = game_state.clone()
+            cloned_board.quick_add(move, game_state._player_turn)
+            result = cloned_board.check_win(cloned_state)
+            cloned_state.switch_turn()
+            if result == None:
+                result = board_move_DFS(cloned_board, cloned_state, solved, False, 1)[0]
+            else:
+                result = SCORES[result]
+            outcomes[tuple(move)] = result * SCORES[game_state._player_turn]
+        if len(set(outcomes.values())) > 1:
+            positions.append((game_board, game_state, outcomes))
+    print('policy  trials  playouts/sec  best move rate')
+    for heavy in [False, True]:
+        for ntrials in ntrials_list:
+            correct = 0
+            start_time = time.time()
+            for game_board, game_state, outcomes in positions:
+                move = board_move_MC(game_board, game_state, ntrials, heavy)
+                if outcomes[tuple(move[1])] == max(outcomes.values()):
+                    correct += 1
+            rate = ntrials * len(positions) / (time.time() - start_time)
+            policy = 'heavy' if heavy else 'light'
+            print('%-7s %6d  %12.0f  %14.2f' % (policy, ntrials, rate, float(correct) / len(positions)))
+
+
+#==============================================================================
+# Static Evaluation Approach
+
+def evaluate_boards(boards, first_player = None, weights = None, mlp = None):
+    """
+    Scores a batch of boards in a single vectorized call. Boards are given as an
+    array of chip values (N, 42) or (N, 7, 6) as returned by GameBoard.to_array.
+    
+    Returns an array of N scores in (-1, 1), positive when PLAYER_1 is ahead.
+    """
+    features = eval_features(boards, first_player)
+    if mlp is None:
+        mlp = EVAL_MLP
+    if mlp is not None:
+        hidden = np.tanh(np.dot(features, mlp[0]) + mlp[1])
+        return np.tanh(np.dot(hidden, mlp[2]) + mlp[3]).ravel()
+    if weights is None:
+        weights = EVAL_WEIGHTS
+    return np.tanh(np.dot(features, weights))
+
+def eval_features(boards, first_player = None):
+    """
+    Returns the (N, 4) feature matrix used by evaluate_boards, each feature
+    taken as PLAYER_1 minus PLAYER_2: open twos, open threes, threats on the
+    rows favoring each player (odd rows for whoever moved first, even rows
+    for the other) and center control.
+    """
+    if first_player == None:
+        first_player = FIRST_TURN
+    boards = np.asarray(boards).reshape(-1, NUM_CHIP_WIDE*NUM_CHIP_HIGH)
+    lines = boards[:, WIN_LINE_IDX]
+    p1_count = (lines == 1).sum(2)
+    p2_count = (lines == -1).sum(2)
+    p1_open = p2_count == 0
+    p2_open = p1_count == 0
+    open_twos = ((p1_open & (p1_count == 2)).sum(1) - 
+                 (p2_open & (p2_count == 2)).sum(1))
+    open_threes = ((p1_open & (p1_count == 3)).sum(1) - 
+                   (p2_open & (p2_count == 3)).sum(1))
+    # The empty cell of an open three is a threat, located on an odd or even row
+    threat_odd = ((lines == 0) & ODD_ROW[WIN_LINE_IDX]).any(2)
+    p1_threats = p1_open & (p1_count == 3)
+    p2_threats = p2_open & (p2_count == 3)
+    if first_player == PLAYER_1:
+        parity = ((p1_threats & threat_odd).sum(1) - 
+                  (p2_threats & ~threat_odd).sum(1))
+    else:
+        parity = ((p1_threats & ~threat_odd).sum(1) - 
+                  (p2_threats & threat_odd).sum(1))
+    center = np.dot(boards, CELL_LINE_COUNT)
+    return np.column_stack((open_twos, open_threes, parity, center)).astype(float)
+
+def fit_eval_weights(boards, outcomes, first_player = None):
+    """
+    Fits linear evaluation weights by least squares to a set of boards and their
+    final outcomes (1 PLAYER_1 win, -1 PLAYER_2 win, 0 draw). The result can be
+    assigned to EVAL_WEIGHTS.
+    """
+    features = eval_features(boards, first_player)
+    targets = np.arctanh(0.9 * np.asarray(outcomes, dtype=float))
+    return np.linalg.lstsq(features, targets, rcond=None)[0]
+
+def load_eval_model(path):
+    """
+    Loads an evaluation model from a .npz file holding either 'weights' for the
+    linear model or 'W1', 'b1', 'W2', 'b2' for a one hidden layer MLP.
+    """
+    global EVAL_WEIGHTS, EVAL_MLP
+    model = np.load(path)
+    if 'weights' in model:
+        EVAL_WEIGHTS = model['weights']
+        EVAL_MLP = None
+    else:
+        EVAL_MLP = (model['W1'], model['b1'], model['W2'], model['b2'])
+
+def board_move_eval(game_board, game_state, depth):
+    """
+    Depth-limited minimax which expands the tree one level at a time over arrays
+    of boards, detects wins with the winning line table and scores all remaining
+    leaves in a single call to evaluate_boards.
+    
+    Returns a tuple with two elements. (Score, [column, row])
+    """
+    width = NUM_CHIP_WIDE
+    height = NUM_CHIP_HIGH
+    player = CHIP_VALUE[game_state._player_turn]
+    boards = game_board.to_array().reshape(1, width*height)
+    first_player = get_first_player(game_board, game_state)
+    alive = np.array([True])
+    levels = []
+    # Expand every live board by each column, recording terminal values
+    for level in range(depth):
+        mover = player * (-1)**level
+        empties = (boards.reshape(-1, width, height) == 0).sum(2)
+        children = np.repeat(boards, width, axis=0)
+        cols = np.tile(np.arange(width), len(boards))
+        rows = empties.ravel() - 1
+        legal = (empties > 0).ravel() & np.repeat(alive, width)
+        children[np.flatnonzero(legal), (cols*height + rows)[legal]] = mover
+        won = legal & (children[:, WIN_LINE_IDX].sum(2) == WIN_LENGTH*mover).any(1)
+        full = legal & ~won & ~(children == 0).any(1)
+        # Wins found sooner are worth more than later wins and any evaluation
+        term_value = np.where(won, mover * (2 + depth - level), 0.0)
+        alive = legal & ~won & ~full
+        levels.append((legal, term_value, alive, rows))
+        boards = children
+    # Score the surviving leaves in one batch and back the values up the tree
+    values = np.zeros(len(boards))
+    if alive.any():
+        values[alive] = evaluate_boards(boards[alive], first_player)
+    for level in reversed(range(depth)):
+        legal, term_value, alive, rows = levels[level]
+        mover = player * (-1)**level
+        child_values = np.where(alive, values, term_value)
+        child_values = np.where(legal, child_values, -mover*np.inf).reshape(-1, width)
+        if level == 0:
+            break
+        if mover == 1:
+            values = child_values.max(1)
         else:
-            if game_board._grid[move[0]][move[1]] == current_player:
-                scores[move] -= 1
-            elif game_board._grid[move[0]][move[1]] == opponent:
-                scores[move] += 1
+            values = child_values.min(1)
+    # Select the best root move, preferring center columns on ties
+    best_score = None
+    for col in sorted(range(width), key = lambda col: abs(col - width//2)):
+        score = child_values[0][col]
+        if legal[col] and (best_score == None or score*player > best_score*player):
+            best_score = score
+            best_move = [col, int(rows[col])]
+    return (float(best_score), best_move)
 
 #=============================================================================
 # Depth First Search (DFS) Move Approach
 
-def board_move_DFS(game_board, game_state, grid, trim, trace, time_check = float('inf')):
+def board_move_DFS(game_board, game_state, grid, trim, trace, time_check = float('inf'), budget = None, rng = None):
     """
     Determine optimal move to make on a given board and game state
     using a recurvise Depth First tree Search with optional trimming of branches.
+    The search stops after time_check seconds or once the optional SearchBudget
+    is spent, returning None. Moves are shuffled with rng (default the random
+    module).
     
     Returns a tuple with three elements. (Score, [column, row], Trace Length)
     """
@@ -293,19 +893,23 @@ def board_move_DFS(game_board, game_state, grid, trim, trace, time_check = float
     temp_player = game_state._player_turn    
     current_grid = str(game_board._grid)
     start_time = time.time()
+    if budget != None:
+        budget.spend()
+    if rng == None:
+        rng = random
     
     # Check if move for current grid has already been determined and if so, use it
     if current_grid in grid:
         best_move = grid[current_grid]
         return best_move
-    elif (time.time()-start_time) < time_check:# If current grid was has not already been determined, run recursion on it.
+    elif within_budget(start_time, time_check, budget):# If current grid was has not already been determined, run recursion on it.
         move_list = []
         # Determine the score of each potential move for each board arrrangement
         avail_moves = game_board.get_available_moves()
-        random.shuffle(avail_moves)
+        rng.shuffle(avail_moves)
         #for potential_move in game_board.get_available_moves():
         for potential_move in avail_moves:
-            if (time.time()-start_time) < time_check:
+            if within_budget(start_time, time_check, budget):
                 cloned_board = game_board.clone()
                 cloned_game_state = game_state.clone()
                 cloned_board.quick_add(potential_move, temp_player)
@@ -326,7 +930,7 @@ def board_move_DFS(game_board, game_state, grid, trim, trace, time_check = float
                 # If terminate state is not found, continued recursion on opponents move            
                 else:
                     new_time = time_check - (time.time() - start_time)
-                    opp_move = board_move_DFS(cloned_board, cloned_game_state, grid, trim, (trace + 1), new_time)
+                    opp_move = board_move_DFS(cloned_board, cloned_game_state, grid, trim, (trace + 1), new_time, budget, rng)
                     if opp_move != None:
                         move_list.append((opp_move[0], potential_move, opp_move[2]))
                         # If trimming, break loop at a guarenteed win or loss.
@@ -338,7 +942,7 @@ def board_move_DFS(game_board, game_state, grid, trim, trace, time_check = float
                                 if opp_move[0] == -1:
                                     break
         # Once all moves and scores are logged, determine, optimal move
-        if (time.time()-start_time) < time_check:
+        if within_budget(start_time, time_check, budget):
             best_move = get_best_score(move_list, temp_player)                    
             # Store a mirrored board and move in the move dictionary
             mirrored_best_move = mirror_move(best_move, NUM_CHIP_WIDE)
@@ -385,18 +989,738 @@ def get_best_score(mlist, player):
     return best_score
 
 
+#==============================================================================
+# Proof-Number (PN) Search Approach
+
+def board_move_PN(game_board, game_state, grid, trace, nodes):
+    """
+    Runs a proof-number search of up to nodes expansions trying to prove a
+    forced win for the player to move, and if that fails, for the opponent.
+    Proven positions are stored in the grid state dictionary.
+    
+    Returns a tuple with three elements (Score, [column, row], Trace Length)
+    for a proven win or loss, otherwise None.
+    """
+    for attacker in [game_state._player_turn, game_state.get_opponent()]:
+        best_move = PN_search(game_board, game_state, grid, trace, attacker, 
+                              SearchBudget(nodes = nodes))
+        if best_move != None:
+            return best_move
+    return None
+
+def PN_search(game_board, game_state, grid, trace, attacker, budget):
+    """
+    Proof-number search for a forced win of the attacker. Positions where the
+    attacker is to move are OR nodes, the others AND nodes. Once the root is 
+    proven, each proven position with the attacker to move is stored in grid 
+    with its quickest winning move (and mirrored), like board_move_DFS.
+    
+    Returns (Score, [column, row], Trace Length) if proven, otherwise None.
+    """
+    root = PNNode([column[:] for column in game_board._grid], game_state._player_turn)
+    root.expand(attacker)
+    budget.spend(len(root._children))
+    # Expand the most-proving node until the root is resolved or budget is spent
+    while root._pn != 0 and root._dn != 0 and not budget.expired():
+        node = root
+        while node._children:
+            node = node.select_child(attacker)
+        node.expand(attacker)
+        budget.spend(len(node._children))
+        while node != None:
+            node.update(attacker)
+            node = node._parent
+    if root._pn != 0:
+        return None
+    # Store the proof and pick the quickest win, or the longest loss
+    if root._player == attacker:
+        return PN_store_proof(root, grid, attacker, trace)[1]
+    plies = [PN_store_proof(child, grid, attacker, trace + 1)[0] for child in root._children]
+    best_idx = plies.index(max(plies))
+    return (SCORES[attacker], root._children[best_idx]._move, trace + plies[best_idx])
+
+def PN_store_proof(node, grid, attacker, trace):
+    """
+    Walks the proof tree below a proven node, storing the quickest winning move
+    of every node where the attacker is to move. Returns the number of moves 
+    until the end of the game from node and its stored move (if any).
+    """
+    if not node._children:
+        return (0, None)
+    proven = [child for child in node._children if child._pn == 0]
+    plies = [PN_store_proof(child, grid, attacker, trace + 1)[0] for child in proven]
+    if node._player != attacker:
+        return (1 + max(plies), None)
+    best_idx = plies.index(min(plies))
+    best_move = (SCORES[attacker], proven[best_idx]._move, trace + plies[best_idx])
+    grid[str(node._grid)] = best_move
+    grid[str(node._grid[::-1])] = mirror_move(best_move, NUM_CHIP_WIDE)
+    return (1 + plies[best_idx], best_move)
+
+
+#==============================================================================
+# Parallel Exact Search Approach
+
+def grid_to_bitboard(grid, player):
+    """
+    Converts a grid to the bitboards used by the exact solver. Returns a tuple
+    (position, mask, moves) with the chips of the player to move, all chips
+    and the number of chips on the board.
+    """
+    position = 0
+    mask = 0
+    moves = 0
+    for col_idx in range(NUM_CHIP_WIDE):
+        for row_idx in range(NUM_CHIP_HIGH):
+            if grid[col_idx][row_idx] != 'WHITE':
+                bit = 1 << (col_idx*COLUMN_BITS + NUM_CHIP_HIGH - 1 - row_idx)
+                mask |= bit
+                moves += 1
+                if grid[col_idx][row_idx] == player:
+                    position |= bit
+    return (position, mask, moves)
+
+def bitboard_to_grid(position, mask, player):
+    """
+    Converts bitboards back to a grid, position holding the chips of player
+    and mask all chips.
+    """
+    opponent = PLAYER_2 if player == PLAYER_1 else PLAYER_1
+    grid = [['WHITE' for row_idx in range(NUM_CHIP_HIGH)] for col_idx in range(NUM_CHIP_WIDE)]
+    for col_idx in range(NUM_CHIP_WIDE):
+        for row_idx in range(NUM_CHIP_HIGH):
+            bit = 1 << (col_idx*COLUMN_BITS + NUM_CHIP_HIGH - 1 - row_idx)
+            if mask & bit:
+                grid[col_idx][row_idx] = player if position & bit else opponent
+    return grid
+
+def bitboard_win(position):
+    """
+    Checks if the chips of a bitboard contain four in a row (vertical,
+    horizontal or either diagonal).
+    """
+    for shift in [1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1]:
+        pairs = position & (position >> shift)
+        if pairs & (pairs >> (2*shift)):
+            return True
+    return False
+
+def TT_get(table, size, key):
+    """
+    Reads the transposition table entry of key as (value, flag), or None. Each
+    entry is stored as (key ^ data, data) so entries torn by a concurrent write
+    from another worker fail the key check instead of returning bad data.
+    """
+    idx = 2*(key % size)
+    data = table[idx + 1]
+    if data and table[idx] ^ data == key:
+        return ((data & 0xff) - 64, (data >> 8) & 0xff)
+    return None
+
+def TT_put(table, size, key, value, flag, moves):
+    """
+    Writes a transposition table entry, packed as value, flag and number of 
+    chips (depth). An entry for another position closer to the root is kept.
+    """
+    idx = 2*(key % size)
+    old_data = table[idx + 1]
+    if old_data and table[idx] ^ old_data != key and (old_data >> 16) < moves:
+        return
+    data = (value + 64) | (flag << 8) | (moves << 16)
+    table[idx] = key ^ data
+    table[idx + 1] = data
+
+def solve_negamax(position, mask, moves, alpha, beta, table, size, order):
+    """
+    Negamax search with alpha-beta pruning on bitboards and a shared 
+    transposition table. Returns the value for the player to move: 
+    BOARD_CELLS + 1 - m for a win completed with the m-th chip, the negative of
+    that for a loss and 0 for a draw.
+    """
+    if moves == BOARD_CELLS:
+        return 0
+    for col in order:
+        if not mask & TOP_BIT[col]:
+            if bitboard_win(position | ((mask + BOTTOM_BIT[col]) & COLUMN_MASK[col])):
+                return BOARD_CELLS - moves
+    if moves + 1 == BOARD_CELLS:
+        return 0
+    # Without an immediate win, the best is a win with our next chip
+    max_value = BOARD_CELLS - moves - 2
+    if beta > max_value:
+        beta = max_value
+        if alpha >= beta:
+            return beta
+    key = position + mask
+    entry = TT_get(table, size, key)
+    if entry != None:
+        if entry[1] == TT_EXACT:
+            return entry[0]
+        elif entry[1] == TT_LOWER:
+            alpha = max(alpha, entry[0])
+        else:
+            beta = min(beta, entry[0])
+        if alpha >= beta:
+            return entry[0]
+    alpha_orig = alpha
+    best_value = -BOARD_CELLS
+    for col in order:
+        if not mask & TOP_BIT[col]:
+            value = -solve_negamax(position ^ mask, mask | (mask + BOTTOM_BIT[col]), 
+                                   moves + 1, -beta, -alpha, table, size, order)
+            if value > best_value:
+                best_value = value
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+    if best_value <= alpha_orig:
+        TT_put(table, size, key, best_value, TT_UPPER, moves)
+    elif best_value >= beta:
+        TT_put(table, size, key, best_value, TT_LOWER, moves)
+    else:
+        TT_put(table, size, key, best_value, TT_EXACT, moves)
+    return best_value
+
+def solve_root(position, mask, moves, table, size, order):
+    """
+    Solves the root exactly, returning (value, column) of the best move
+    """
+    for col in order:
+        if not mask & TOP_BIT[col]:
+            if bitboard_win(position | ((mask + BOTTOM_BIT[col]) & COLUMN_MASK[col])):
+                return (BOARD_CELLS - moves, col)
+    best_value = None
+    alpha = -BOARD_CELLS
+    for col in order:
+        if not mask & TOP_BIT[col]:
+            value = -solve_negamax(position ^ mask, mask | (mask + BOTTOM_BIT[col]), 
+                                   moves + 1, -BOARD_CELLS, -alpha, table, size, order)
+            if best_value == None or value > best_value:
+                best_value, best_col = value, col
+                alpha = max(alpha, value)
+    return (best_value, best_col)
+
+def parallel_worker(shm_name, size, position, mask, moves, order, results):
+    """
+    Worker process of board_move_parallel, solving the root with its own move
+    order on the shared transposition table and putting the result in results.
+    """
+    shm = shared_memory.SharedMemory(name = shm_name)
+    table = shm.buf.cast('Q')
+    results.put(solve_root(position, mask, moves, table, size, order))
+    table.release()
+    shm.close()
+
+def board_move_parallel(game_board, game_state, workers, time_check = None, grid = None, trace = 1):
+    """
+    Lazy SMP exact search. Worker processes solve the same root with different
+    move orders, sharing one fixed-size, lock-free transposition table in shared
+    memory, and the first one to finish gives the answer. The result is stored 
+    (and mirrored) in grid if given, like board_move_DFS.
+    
+    Returns (Score, [column, row], Trace Length), or None after time_check seconds.
+    """
+    for best_move in board_move_parallel_iter(game_board, game_state, workers, time_check, grid, trace):
+        pass
+    return best_move
+
+def board_move_parallel_iter(game_board, game_state, workers, time_check = None, grid = None, trace = 1):
+    """
+    Generator version of board_move_parallel which waits for the workers in
+    steps of ANYTIME_SLICE seconds, yielding None after each step until the
+    last value, the result (None after time_check seconds). The workers are
+    stopped when the generator finishes or is closed.
+    """
+    if time_check == None:
+        time_check = float('inf')
+    player = game_state._player_turn
+    position, mask, moves = grid_to_bitboard(game_board._grid, player)
+    shm = shared_memory.SharedMemory(create = True, size = 16*TT_ENTRIES)
+    shm.buf[:] = bytes(16*TT_ENTRIES)
+    results = multiprocessing.Queue()
+    # The first worker searches center columns first, the others shuffled orders
+    center_order = sorted(range(NUM_CHIP_WIDE), key = lambda col: abs(col - NUM_CHIP_WIDE//2))
+    processes = []
+    try:
+        for worker in range(workers):
+            order = center_order[:]
+            if worker > 0:
+                random.Random(worker).shuffle(order)
+            process = multiprocessing.Process(target = parallel_worker, 
+                                              args = (shm.name, TT_ENTRIES, position, mask, moves, order, results))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+        start_time = time.time()
+        value = None
+        while value == None:
+            time_remaining = time_check - (time.time() - start_time)
+            if time_remaining <= 0:
+                break
+            try:
+                value, col = results.get(timeout = min(ANYTIME_SLICE, time_remaining))
+            except Exception:
+                yield None
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        shm.close()
+        shm.unlink()
+    if value == None:
+        yield None
+        return
+    best_move = solver_move(game_board, game_state, value, col, trace)
+    if grid != None:
+        grid[str(game_board._grid)] = best_move
+        grid[str(game_board.get_mirror_grid())] = mirror_move(best_move, NUM_CHIP_WIDE)
+    yield best_move
+
+def solver_move(game_board, game_state, value, col, trace):
+    """
+    Converts a solver value of playing col into the (Score, [column, row], 
+    Trace Length) format of board_move_DFS
+    """
+    if value > 0:
+        score = SCORES[game_state._player_turn]
+    elif value < 0:
+        score = SCORES[game_state.get_opponent()]
+    else:
+        score = SCORES['DRAW']
+    moves = BOARD_CELLS - len(game_board.get_state_indices('WHITE'))
+    last_move = BOARD_CELLS + 1 - abs(value) if value != 0 else BOARD_CELLS
+    return (score, [col, game_board.get_empty_slot(col)], trace + last_move - moves - 1)
+
+#==============================================================================
+# Endgame Database Approach
+
+def mirror_bits(bits):
+    """
+    Mirrors the columns of a bitboard (or bitboard key)
+    """
+    mirrored = 0
+    for col in range(NUM_CHIP_WIDE):
+        column = (bits >> (col*COLUMN_BITS)) & ((1 << COLUMN_BITS) - 1)
+        mirrored |= column << ((NUM_CHIP_WIDE - 1 - col)*COLUMN_BITS)
+    return mirrored
+
+def canonical_key(position, mask):
+    """
+    Returns the key of a position (player to move chips plus all chips), taking
+    the smaller of it and its mirror so mirrored positions share one entry.
+    """
+    key = position + mask
+    return min(key, mirror_bits(key))
+
+def build_endgame_db(roots, empty_spaces = ENDGAME_EMPTY, path = ENDGAME_DB_PATH):
+    """
+    Builds the endgame database offline. Every position reachable from the
+    roots (a list of (GameBoard, GameState)) with at most empty_spaces empty
+    spaces is enumerated, then solved retrograde from the fullest boards back,
+    each value coming from the already solved children. The values are saved
+    as a key-sorted array of (canonical key, solver value).
+    
+    Returns the number of positions stored.
+    """
+    nodes = {}
+    for game_board, game_state in roots:
+        position, mask, moves = grid_to_bitboard(game_board._grid, game_state._player_turn)
+        if game_state._winner == None and BOARD_CELLS - moves <= empty_spaces:
+            endgame_enumerate(position, mask, moves, nodes)
+    # Retrograde pass, fullest boards first
+    values = {}
+    for key, (position, mask, moves) in sorted(nodes.items(), key = lambda item: -item[1][2]):
+        best_value = -BOARD_CELLS
+        for col in range(NUM_CHIP_WIDE):
+            if not mask & TOP_BIT[col]:
+                new_mask = mask | (mask + BOTTOM_BIT[col])
+                if bitboard_win(position | (new_mask ^ mask)):
+                    value = BOARD_CELLS - moves
+                elif moves + 1 == BOARD_CELLS:
+                    value = 0
+                else:
+                    value = -values[canonical_key(position ^ mask, new_mask)]
+                best_value = max(best_value, value)
+        values[key] = best_value
+    database = np.zeros(len(values), dtype = [('key', '<u8'), ('value', 'i1')])
+    database['key'] = sorted(values)
+    database['value'] = [values[key] for key in database['key'].tolist()]
+    np.save(path, database)
+    return len(database)
+
+def endgame_roots(games, empty_spaces = ENDGAME_EMPTY):
+    """
+    Replays game records (the columns played, starting with PLAYER_1) and 
+    returns the (GameBoard, GameState) of each game at empty_spaces empty 
+    spaces, for the games still in progress there. Raises a ValueError on an
+    illegal move.
+    """
+    roots = []
+    for columns in games:
+        game_board = GameBoard(NUM_CHIP_WIDE, NUM_CHIP_HIGH, WIN_LENGTH)
+        game_state = GameState(PLAYER_1)
+        game_state.start_game()
+        for column in columns:
+            if game_state._game_over or len(game_board.get_state_indices('WHITE')) <= empty_spaces:
+                break
+            row = None
+            if 0 <= column < NUM_CHIP_WIDE:
+                row = game_board.get_empty_slot(column)
+            if row == None:
+                raise ValueError('Illegal move in column %s' % (column))
+            game_board.quick_add([column, row], game_state._player_turn)
+            game_board.check_win(game_state)
+            game_state.switch_turn()
+        if game_state._winner == None and len(game_board.get_state_indices('WHITE')) == empty_spaces:
+            roots.append((game_board, game_state))
+    return roots
+
+def endgame_enumerate(position, mask, moves, nodes):
+    """
+    Adds a non-terminal position and all of its non-terminal descendants to 
+    nodes, keyed by canonical key.
+    """
+    key = canonical_key(position, mask)
+    if key in nodes:
+        return
+    nodes[key] = (position, mask, moves)
+    for col in range(NUM_CHIP_WIDE):
+        if not mask & TOP_BIT[col]:
+            new_mask = mask | (mask + BOTTOM_BIT[col])
+            if not bitboard_win(position | (new_mask ^ mask)) and moves + 1 < BOARD_CELLS:
+                endgame_enumerate(position ^ mask, new_mask, moves + 1, nodes)
+
+def endgame_lookup(position, mask):
+    """
+    Returns the solver value of a position from the endgame database, or None
+    if the database or the position is missing.
+    """
+    global ENDGAME_DB
+    if ENDGAME_DB is None:
+        if not os.path.exists(ENDGAME_DB_PATH):
+            return None
+        ENDGAME_DB = np.load(ENDGAME_DB_PATH, mmap_mode = 'r')
+    keys = ENDGAME_DB['key']
+    key = canonical_key(position, mask)
+    idx = int(np.searchsorted(keys, key))
+    if idx < len(keys) and int(keys[idx]) == key:
+        return int(ENDGAME_DB['value'][idx])
+    return None
+
+def board_move_endgame(game_board, game_state, trace = 1):
+    """
+    Determines the best move by looking up each child position in the endgame
+    database. Returns (Score, [column, row], Trace Length), or None if any 
+    child is missing.
+    """
+    position, mask, moves = grid_to_bitboard(game_board._grid, game_state._player_turn)
+    best_value = None
+    for col in sorted(range(NUM_CHIP_WIDE), key = lambda col: abs(col - NUM_CHIP_WIDE//2)):
+        if not mask & TOP_BIT[col]:
+            new_mask = mask | (mask + BOTTOM_BIT[col])
+            if bitboard_win(position | (new_mask ^ mask)):
+                value = BOARD_CELLS - moves
+            elif moves + 1 == BOARD_CELLS:
+                value = 0
+            else:
+                value = endgame_lookup(position ^ mask, new_mask)
+                if value == None:
+                    return None
+                value = -value
+            if best_value == None or value > best_value:
+                best_value, best_col = value, col
+    if best_value == None:
+        return None
+    return solver_move(game_board, game_state, best_value, best_col, trace)
+
+
+#==============================================================================
+# Profiling
+
+def profile_move(game_board, game_state, path, interval = 0.001):
+    """
+    Runs get_move under a sampling profiler. A background thread records the
+    stack of the search every interval seconds; the samples are written to path
+    as collapsed stacks ('outer;inner count' lines, read by flamegraph tools) 
+    and a summary of the time per phase, per operation and per function is
+    printed. Returns the dictionary of collapsed stack counts.
+    """
+    samples = {}
+    thread_id = threading.current_thread().ident
+    done = threading.Event()
+    def sampler():
+        while not done.is_set():
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame != None:
+                stack.append(profile_frame_name(frame))
+                frame = frame.f_back
+            stack = ';'.join(reversed(stack))
+            samples[stack] = samples.get(stack, 0) + 1
+            time.sleep(interval)
+    # Switch threads often enough for the sampler to keep its interval
+    # (Python 2 only has the bytecode check interval)
+    if hasattr(sys, 'setswitchinterval'):
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(interval)
+    else:
+        switch_interval = sys.getcheckinterval()
+        sys.setcheckinterval(10)
+    sampler_thread = threading.Thread(target = sampler)
+    sampler_thread.daemon = True
+    start_time = time.time()
+    sampler_thread.start()
+    try:
+        move = get_move(game_board, game_state)
+    finally:
+        done.set()
+        sampler_thread.join()
+        if hasattr(sys, 'setswitchinterval'):
+            sys.setswitchinterval(switch_interval)
+        else:
+            sys.setcheckinterval(switch_interval)
+    elapsed = time.time() - start_time
+    with open(path, 'w') as folded_file:
+        for stack in sorted(samples):
+            folded_file.write('%s %d\n' % (stack, samples[stack]))
+    # Attribute the samples to phases, operations and innermost functions
+    phases = {}
+    operations = {}
+    functions = {}
+    for stack, count in samples.items():
+        names = [name.split('.')[-1] for name in stack.split(';')]
+        phase = 'other'
+        for name in names:
+            if name in PROFILE_PHASES:
+                phase = PROFILE_PHASES[name]
+                break
+        operation = 'other'
+        for name in reversed(names):
+            if name in PROFILE_OPERATIONS:
+                operation = PROFILE_OPERATIONS[name]
+                break
+        phases[phase] = phases.get(phase, 0) + count
+        operations[operation] = operations.get(operation, 0) + count
+        functions[stack.split(';')[-1]] = functions.get(stack.split(';')[-1], 0) + count
+    total = float(max(sum(samples.values()), 1))
+    print('Move %s in %.2f s, %d samples written to %s' % (move[1], elapsed, total, path))
+    for title, counts in [('Phase', phases), ('Operation', operations), ('Function (self)', functions)]:
+        print('\n%-40s %8s' % (title, 'time %'))
+        for name in sorted(counts, key = lambda name: -counts[name])[:10]:
+            print('%-40s %8.1f' % (name, 100 * counts[name] / total))
+    return samples
+
+def profile_frame_name(frame):
+    """
+    Name of a stack frame in the collapsed stacks, the function name for this
+    file and module.function for others
+    """
+    name = frame.f_code.co_name
+    filename = frame.f_code.co_filename
+    if os.path.abspath(filename) == os.path.abspath(__file__):
+        return name
+    return '%s.%s' % (os.path.splitext(os.path.basename(filename))[0], name)
+
+
 ###############################################################################
 # 3. Classes
-        
+
+class SearchBudget():
+    """
+    Class Object for limiting a search, and all of its recursive calls, by
+    seconds and/or number of nodes visited
+    """
+    def __init__(self, seconds = float('inf'), nodes = float('inf')):
+        """
+        Initialize the limits of the search
+        """
+        self._deadline = time.time() + seconds
+        self._max_nodes = nodes
+        self._nodes = 0
+    
+    def spend(self, nodes = 1):
+        self._nodes += nodes
+    
+    def expired(self):
+        return self._nodes >= self._max_nodes or time.time() >= self._deadline
+
+    def get_nodes(self):
+        return self._nodes
+
+#==============================================================================
+
+class BackgroundSolver():
+    """
+    Class Object which schedules the positions to solve with spare move time.
+    After a move, the positions most likely to come up next (the opponent 
+    replies ranked by the evaluation function, and our best answer to the 
+    likeliest ones) are queued by priority and solved with a trimmed DFS into 
+    the move dictionary, stopping whenever the budget runs out. Positions are
+    held as bitboards (see grid_to_bitboard) and only the positions solved 
+    after the last two moves are kept, so a solver stays small between turns.
+    """
+    def __init__(self):
+        """
+        Initialize an empty queue and the usage counters
+        """
+        self._queue = []
+        self._predicted = set()
+        self._finished = [set(), set()]
+        self._count = 0
+        self._turns = 0
+        self._hits = 0
+        self._solved = 0
+    
+    def reset(self):
+        """
+        Clears the queue, predicted and solved positions (when the dictionaries
+        are cleared or the game is over), keeping the usage counters
+        """
+        self._queue = []
+        self._predicted = set()
+        self._finished = [set(), set()]
+    
+    def push(self, game_board, game_state, trace, priority):
+        """
+        Queues a position, lower priorities being solved first
+        """
+        player = game_state._player_turn
+        position, mask, moves = grid_to_bitboard(game_board._grid, player)
+        key = canonical_key(position, mask)
+        if key not in self._predicted:
+            self._predicted.add(key)
+            self._count += 1
+            heapq.heappush(self._queue, (priority, self._count, position, mask, player, trace))
+    
+    def schedule(self, game_board, game_state, selected_move, trace):
+        """
+        Replaces the queue with the positions predicted after selected_move.
+        The position right after the move (opponent to move) is queued last, 
+        covering every reply like the old dictionary build did.
+        """
+        self._queue = []
+        self._predicted = set()
+        self._finished = [set(), self._finished[0]]
+        new_board = game_board.clone()
+        new_state = game_state.clone()
+        new_board.quick_add(selected_move[1], new_state._player_turn)
+        if new_board.check_win(new_state) != None:
+            return
+        new_state.switch_turn()
+        self.predict(new_board, new_state, trace + 1, 0, SCHEDULER_DEPTH)
+        self.push(new_board, new_state, trace + 1, float('inf'))
+    
+    def predict(self, game_board, game_state, trace, priority, depth):
+        """
+        Queues the positions after each opponent reply (opponent to move on 
+        game_board), ranked by the evaluation function for the opponent. The
+        likeliest replies are followed further with our best evaluated answer.
+        """
+        replies = []
+        for move in game_board.get_available_moves():
+            reply_board = game_board.clone()
+            reply_state = game_state.clone()
+            reply_board.quick_add(move, reply_state._player_turn)
+            if reply_board.check_win(reply_state) == None:
+                reply_state.switch_turn()
+                replies.append((reply_board, reply_state))
+        if not replies:
+            return
+        scores = evaluate_boards(np.array([reply[0].to_array() for reply in replies]), 
+                                 get_first_player(game_board, game_state))
+        scores = scores * CHIP_VALUE[game_state._player_turn]
+        for rank, idx in enumerate(np.argsort(-scores, kind = 'stable')):
+            reply_board, reply_state = replies[idx]
+            reply_priority = priority + 1 + 2*rank
+            self.push(reply_board, reply_state, trace + 1, reply_priority)
+            if depth > 2 and rank < SCHEDULER_WIDTH:
+                answer = board_move_eval(reply_board, reply_state, 1)
+                answer_board = reply_board.clone()
+                answer_state = reply_state.clone()
+                answer_board.quick_add(answer[1], answer_state._player_turn)
+                if answer_board.check_win(answer_state) == None:
+                    answer_state.switch_turn()
+                    self.predict(answer_board, answer_state, trace + 2, reply_priority + 1, depth - 2)
+    
+    def solve_queue(self, grid, budget):
+        """
+        Solves queued positions in priority order into grid until the budget
+        is spent, recording the positions it finishes. A position cut short 
+        stays at the front of the queue, keeping the subtrees it finished in 
+        grid. Returns True once the queue is empty.
+        """
+        while self._queue and not budget.expired():
+            priority, count, position, mask, player, trace = self._queue[0]
+            game_board = GameBoard(NUM_CHIP_WIDE, NUM_CHIP_HIGH, WIN_LENGTH, 
+                                   grid = bitboard_to_grid(position, mask, player))
+            if str(game_board._grid) not in grid:
+                game_state = GameState(player)
+                game_state.start_game()
+                if board_move_DFS(game_board, game_state, grid, True, trace, budget = budget) == None:
+                    break
+                self._solved += 1
+                self._finished[0].add(canonical_key(position, mask))
+            heapq.heappop(self._queue)
+        return not self._queue
+    
+    def lookup(self, game_board, game_state, grid):
+        """
+        Counts a turn and returns the move stored in grid for the board (None
+        if there is none), counting a hit if solve_queue finished it after one
+        of the last two moves.
+        """
+        self._turns += 1
+        grid_key = str(game_board._grid)
+        if grid_key not in grid:
+            return None
+        position, mask, moves = grid_to_bitboard(game_board._grid, game_state._player_turn)
+        key = canonical_key(position, mask)
+        if key in self._finished[0] or key in self._finished[1]:
+            self._hits += 1
+        return grid[grid_key]
+    
+    def get_memory(self):
+        """
+        Returns the approximate number of bytes held by the solver, counting
+        the queue entries and the predicted and solved position keys
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+        size += sys.getsizeof(self._queue) + sys.getsizeof(self._finished)
+        for entry in self._queue:
+            # Every item except the player, a shared string
+            size += sys.getsizeof(entry) + sum(sys.getsizeof(item) for item in entry[:4] + entry[5:])
+        for keys in [self._predicted] + self._finished:
+            size += sys.getsizeof(keys) + sum(sys.getsizeof(key) for key in keys)
+        return size
+    
+    def get_stats(self):
+        """
+        Returns the number of turns, the turns whose position the solver had
+        already solved (hits), the hit rate, the number of queued positions
+        solved and the queue size.
+        """
+        return {'turns' : self._turns,
+                'hits' : self._hits,
+                'hit_rate' : float(self._hits) / max(self._turns, 1),
+                'solved' : self._solved,
+                'queued' : len(self._queue)}
+
+#==============================================================================
+
 class GameState():
     """
     Class Object for tracking the state of the game
     """
-    def __init__(self):
+    def __init__(self, first_turn = None):
         """
-        Initialize Variables for starting point of a game.
+        Initialize Variables for starting point of a game. The first turn 
+        defaults to FIRST_TURN.
         """
-        self._player_turn = FIRST_TURN
+        self._first_turn = first_turn
+        if first_turn == None:
+            first_turn = FIRST_TURN
+        self._player_turn = first_turn
         self._chip_in_play = []
         self._game_over = True
         self._winner = None
@@ -413,7 +1737,7 @@ class GameState():
         return ans
         
     def start_game(self):
-        self.__init__()
+        self.__init__(self._first_turn)
         self._game_over = False
        
     def set_AI_status(self, boolean):
@@ -453,6 +1777,215 @@ class GameState():
             self._winner = 'DRAW'    
         self._game_over = True
 
+#==============================================================================
+class PNNode():
+    """
+    Node of the proof-number search tree, holding its grid, the player to move, 
+    the move leading to it and its proof and disproof numbers.
+    """
+    __slots__ = ['_grid', '_player', '_move', '_parent', '_children', '_pn', '_dn']
+    
+    def __init__(self, grid, player, move = None, parent = None):
+        """
+        Initialize an unexpanded node
+        """
+        self._grid = grid
+        self._player = player
+        self._move = move
+        self._parent = parent
+        self._children = []
+        self._pn = 1
+        self._dn = 1
+    
+    def set_result(self, proven):
+        """
+        Marks a terminal node as proven (attacker won) or disproven
+        """
+        if proven:
+            self._pn, self._dn = 0, float('inf')
+        else:
+            self._pn, self._dn = float('inf'), 0
+    
+    def expand(self, attacker):
+        """
+        Creates a child for each available move, resolving children where the
+        move wins or fills the board.
+        """
+        opponent = PLAYER_2 if self._player == PLAYER_1 else PLAYER_1
+        for move in get_grid_moves(self._grid):
+            child_grid = [column[:] for column in self._grid]
+            child_grid[move[0]][move[1]] = self._player
+            child = PNNode(child_grid, opponent, move, self)
+            if is_winning_move(child_grid, move, self._player):
+                child.set_result(self._player == attacker)
+            elif move[1] == 0 and not get_grid_moves(child_grid):
+                child.set_result(False)
+            self._children.append(child)
+        self.update(attacker)
+        
+    def update(self, attacker):
+        """
+        Recomputes the proof and disproof numbers from the children
+        """
+        if not self._children:
+            return
+        pns = [child._pn for child in self._children]
+        dns = [child._dn for child in self._children]
+        if self._player == attacker:
+            self._pn, self._dn = min(pns), sum(dns)
+        else:
+            self._pn, self._dn = sum(pns), min(dns)
+    
+    def select_child(self, attacker):
+        """
+        Returns the child on the path to the most-proving node
+        """
+        if self._player == attacker:
+            return min(self._children, key = lambda child: child._pn)
+        return min(self._children, key = lambda child: child._dn)
+
+#==============================================================================
+class Session():
+    """
+    Class Object for a single game hosted by an Engine, with its own board,
+    game state and difficulty level
+    """
+    __slots__ = ['_board', '_state', '_level', '_solver']
+    
+    def __init__(self, first_turn = PLAYER_1, level = 'Medium'):
+        """
+        Initialize a started game
+        """
+        self._board = GameBoard(NUM_CHIP_WIDE, NUM_CHIP_HIGH, WIN_LENGTH)
+        self._state = GameState(first_turn)
+        self._state.start_game()
+        self._level = level
+        self._solver = BackgroundSolver()
+    
+    def get_memory(self):
+        """
+        Returns the approximate number of bytes held by the session alone 
+        (the board, its grid lists, the game state and the background solver)
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self._level) + self._solver.get_memory()
+        for obj in [self._board, self._state]:
+            size += sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+        size += sys.getsizeof(self._board._grid)
+        for column in self._board._grid:
+            size += sys.getsizeof(column)
+        return size
+
+#==============================================================================
+class Engine():
+    """
+    Engine Object which hosts many games (sessions) in one process. Each session
+    has its own GameBoard and GameState, while the grid state dictionaries are
+    shared by the sessions with the same first turn. The dictionaries are keyed
+    by the grid alone, which only tells whose turn it is once the first turn is
+    known, so games started by different players keep separate dictionaries.
+    Entries are only ever added, so sessions can use them at the same time.
+    """
+    def __init__(self, max_entries = 2000000, move_seconds = 1.0):
+        """
+        Initialize empty shared dictionaries and sessions. The dictionaries 
+        are cleared once they hold more than max_entries positions. Computer
+        moves stop searching after move_seconds unless given their own limit.
+        """
+        self._tables = {}
+        for first_turn in [PLAYER_1, PLAYER_2]:
+            self._tables[first_turn] = {PLAYER_1 : ({}, {}),
+                                        PLAYER_2 : ({}, {})}
+        self._sessions = {}
+        self._next_id = 0
+        self._max_entries = max_entries
+        self._move_seconds = move_seconds
+    
+    def new_session(self, first_turn = PLAYER_1, level = 'Medium'):
+        """
+        Starts a new game and returns its session id
+        """
+        session_id = self._next_id
+        self._next_id += 1
+        self._sessions[session_id] = Session(first_turn, level)
+        return session_id
+    
+    def end_session(self, session_id):
+        self._sessions.pop(session_id, None)
+    
+    def get_session(self, session_id):
+        return self._sessions[session_id]
+    
+    def play_move(self, session_id, column):
+        """
+        Drops a chip for the player to move in the given column and returns
+        the winner of the game (None while the game is in progress).
+        """
+        session = self._sessions[session_id]
+        board, state = session._board, session._state
+        if not 0 <= column < NUM_CHIP_WIDE:
+            raise ValueError('Illegal move in column %s' % (column))
+        row = board.get_empty_slot(column)
+        if state._game_over or row == None:
+            raise ValueError('Illegal move in column %s' % (column))
+        board.quick_add([column, row], state._player_turn)
+        board.check_win(state)
+        state.switch_turn()
+        if state._game_over:
+            session._solver.reset()
+        return state._winner
+    
+    def computer_move(self, session_id, seconds = None):
+        """
+        Determines the computer move for the player to move using the
+        dictionaries shared with the games of the same first turn, plays it
+        and returns the chosen column. The search stops after seconds 
+        (default move_seconds, see get_move_within), so the time based level
+        doesn't hold the caller for the whole MOVE_TIME.
+        """
+        session = self._sessions[session_id]
+        if seconds == None:
+            seconds = self._move_seconds
+        move = get_move_within(session._board, session._state, seconds, tables = self.get_tables(session_id), 
+                               level = session._level, solver = session._solver)
+        if self.get_table_entries() > self._max_entries:
+            for tables in self._tables.values():
+                for full_grid, trim_grid in tables.values():
+                    full_grid.clear()
+                    trim_grid.clear()
+            for other in self._sessions.values():
+                other._solver.reset()
+        self.play_move(session_id, move[1][0])
+        return move[1][0]
+    
+    def get_tables(self, session_id):
+        """
+        Returns the shared dictionaries for a session (see get_grid_tables),
+        those of the games with the same first turn
+        """
+        first_turn = self._sessions[session_id]._state._first_turn
+        if first_turn == None:
+            first_turn = FIRST_TURN
+        return self._tables[first_turn]
+    
+    def get_table_entries(self):
+        """
+        Returns the number of positions stored in the shared dictionaries
+        """
+        return sum(len(full_grid) + len(trim_grid) for tables in self._tables.values()
+                   for full_grid, trim_grid in tables.values())
+    
+    def get_memory(self):
+        """
+        Returns the number of sessions, their total and average size in bytes 
+        and the number of shared dictionary entries
+        """
+        total = sum(session.get_memory() for session in self._sessions.values())
+        count = len(self._sessions)
+        return {'sessions' : count, 
+                'session_bytes' : total, 
+                'bytes_per_session' : total / max(count, 1),
+                'table_entries' : self.get_table_entries()}
+
 #==============================================================================        
 class Chip:
     """
@@ -588,6 +2121,14 @@ class GameBoard:
         """
         self._grid = [['WHITE' for row_idx in range(self._y_chips)] for col_idx in range(self._x_chips)] 
     
+    def to_array(self):
+        """
+        Returns a numpy array representation of the grid, called by
+        array[column][row], holding the CHIP_VALUE of each slot.
+        """
+        return np.array([[CHIP_VALUE[cell] for cell in column] for column in self._grid], 
+                        dtype = np.int8)
+    
     def get_mirror_grid(self):
         """
         Function which takes the grid representation and mirrors the column
@@ -758,6 +2299,9 @@ def mdown_handler(pos):
             set_opponent('Human')
         elif vs_nick_button.collidepoint(pos):
             set_opponent('Computer')
+        elif level_button.collidepoint(pos):
+            next_level = (DIFFICULTY_ORDER.index(LEVEL) + 1) % len(DIFFICULTY_ORDER)
+            set_difficulty(DIFFICULTY_ORDER[next_level])
     # Chip Stack Interaction    
     if current_gstate._game_over == False:
         # Pick up chip for respective player
@@ -797,7 +2341,7 @@ def draw_handler(canvas):
     in positions.
     """
     global red_stack, blue_stack, First_button, Second_button, start_button, stop_button
-    global vs_hum_button, vs_nick_button
+    global vs_hum_button, vs_nick_button, level_button
     #==================Initialize==============================================
     # Initialize Fonts
     comic_sans_10 = pygame.font.Font(pygame.font.match_font('comicsansms'), 10)
@@ -844,6 +2388,8 @@ def draw_handler(canvas):
         vs_hum_button = canvas.blit(vs_hum, (DISPLAY_WIDTH-125, 80))
         vs_nick = comic_sans_18.render("Nicolas", True, pygame.Color('Dark Green'))
         vs_nick_button = canvas.blit(vs_nick, (DISPLAY_WIDTH-125, 105))
+        level = comic_sans_18.render('Level: %s' % (LEVEL), True, pygame.Color('Dark Green'))
+        level_button = canvas.blit(level, (DISPLAY_WIDTH-125, 130))
         if BRAIN[PLAYER_2] == 'Computer':
             pygame.draw.circle(canvas, pygame.Color('Brown'), (DISPLAY_WIDTH-20, 120), 8)
         else:
@@ -872,12 +2418,171 @@ def draw_handler(canvas):
     #=================Update Display===========================================
     pygame.display.update()
 
+#==============================================================================
+# Headless Rendering
+
+def load_assets():
+    """
+    Loads the chip stack and button images in ASSET_FILES from IMAGE_DIR and
+    returns a dictionary of the scaled surfaces. The display mode must be set.
+    """
+    assets = {}
+    for name, (file_name, size) in ASSET_FILES.items():
+        image = pygame.image.load(os.path.join(IMAGE_DIR, file_name)).convert_alpha()
+        assets[name] = pygame.transform.scale(image, size)
+    return assets
+
+def render_init():
+    """
+    Initializer for the render processes. Starts pygame on the SDL dummy video
+    driver (no display needed) and caches the surfaces shared by every frame:
+    the background (board with empty slots, chip stacks and buttons), one chip
+    per player and the fonts.
+    """
+    global RENDER_CACHE
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    assets = load_assets()
+    background = pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT))
+    background.fill(pygame.Color('white'))
+    GameBoard(NUM_CHIP_WIDE, NUM_CHIP_HIGH, WIN_LENGTH).draw(background)
+    pygame.draw.rect(background, pygame.Color('Red'), red_chip_outline)
+    background.blit(assets['red_chip_stack'], (0,DISPLAY_HEIGHT-70))
+    pygame.draw.rect(background, pygame.Color('Blue'), blue_chip_outline)
+    background.blit(assets['blue_chip_stack'], (DISPLAY_WIDTH - 125,DISPLAY_HEIGHT-70))
+    background.blit(assets['start_b'], (DISPLAY_WIDTH/2 - 100, DISPLAY_HEIGHT - 70))
+    background.blit(assets['stop_b'], (DISPLAY_WIDTH/2 - 0, DISPLAY_HEIGHT - 70))
+    chips = {}
+    for player in [PLAYER_1, PLAYER_2]:
+        chips[player] = pygame.Surface((CHIP_DIAMETER, CHIP_DIAMETER), pygame.SRCALPHA)
+        pygame.draw.circle(chips[player], pygame.Color(player), 
+                           (CHIP_DIAMETER/2, CHIP_DIAMETER/2), CHIP_DIAMETER/2)
+    RENDER_CACHE = {'canvas' : pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT)),
+                    'background' : background,
+                    'chips' : chips,
+                    'font_18' : pygame.font.Font(pygame.font.match_font('comicsansms'), 18),
+                    'font_25' : pygame.font.Font(pygame.font.match_font('comicsansms'), 25),
+                    'text' : {}}
+
+def render_text(message, font_name):
+    """
+    Returns the rendered surface for a message, cached by message and font
+    """
+    key = (message, font_name)
+    if key not in RENDER_CACHE['text']:
+        RENDER_CACHE['text'][key] = RENDER_CACHE[font_name].render(message, True, pygame.Color('Black'))
+    return RENDER_CACHE['text'][key]
+
+def render_frame(game_board, game_state, falling = None):
+    """
+    Draws a board onto the cached canvas and returns it, with the messages of
+    draw_handler. falling is an optional (player, (x, y)) chip drawn over the
+    board while it drops.
+    """
+    canvas = RENDER_CACHE['canvas']
+    chips = RENDER_CACHE['chips']
+    canvas.blit(RENDER_CACHE['background'], (0, 0))
+    for player in [PLAYER_1, PLAYER_2]:
+        for idx in game_board.get_state_indices(player):
+            chip_loc = idx_to_pos(idx)
+            canvas.blit(chips[player], (chip_loc[0] - CHIP_DIAMETER/2, chip_loc[1] - CHIP_DIAMETER/2))
+    if falling != None:
+        player, chip_loc = falling
+        canvas.blit(chips[player], (chip_loc[0] - CHIP_DIAMETER/2, chip_loc[1] - CHIP_DIAMETER/2))
+    if game_state._game_over:
+        if game_state._winner == 'DRAW':
+            canvas.blit(render_text("DRAW!", 'font_25'), (DISPLAY_WIDTH/2-120, 25))
+        else:
+            canvas.blit(render_text("Player %s WINS!" % (game_state._winner), 'font_25'), 
+                        (DISPLAY_WIDTH/2-120, 25))
+    else:
+        canvas.blit(render_text("Player %s's Turn." % (game_state._player_turn), 'font_18'), (3, 5))
+    return canvas
+
+def render_game(job):
+    """
+    Replays a game record (the columns played, starting with PLAYER_1) and 
+    saves a PNG of the board after each move, named <prefix>_<frame>.png. If
+    animate is set, the frames of each chip dropping into its slot are saved
+    too. Stops at the end of the game and raises a ValueError on an illegal 
+    move. Returns the number of images saved.
+    
+    job is a tuple (columns, prefix, animate) so it can be sent to a Pool.
+    """
+    columns, prefix, animate = job
+    if RENDER_CACHE == None:
+        render_init()
+    game_board = GameBoard(NUM_CHIP_WIDE, NUM_CHIP_HIGH, WIN_LENGTH)
+    game_state = GameState(PLAYER_1)
+    game_state.start_game()
+    pygame.image.save(render_frame(game_board, game_state), '%s_%03d.png' % (prefix, 0))
+    count = 1
+    for column in columns:
+        if game_state._game_over:
+            break
+        row = None
+        if 0 <= column < NUM_CHIP_WIDE:
+            row = game_board.get_empty_slot(column)
+        if row == None:
+            raise ValueError('Illegal move in column %s of %s' % (column, prefix))
+        player = game_state._player_turn
+        if animate:
+            final_pos = idx_to_pos((column, row))
+            y_pos = game_board._loc[1] - CHIP_DIAMETER/2
+            while y_pos < final_pos[1]:
+                canvas = render_frame(game_board, game_state, (player, (final_pos[0], y_pos)))
+                pygame.image.save(canvas, '%s_%03d.png' % (prefix, count))
+                count += 1
+                y_pos += DROP_STEP
+        game_board.quick_add([column, row], player)
+        game_board.check_win(game_state)
+        game_state.switch_turn()
+        pygame.image.save(render_frame(game_board, game_state), '%s_%03d.png' % (prefix, count))
+        count += 1
+    return count
+
+def render_games(games, out_dir, animate = False, workers = None):
+    """
+    Renders a list of game records (see render_game) to PNG files in out_dir
+    with a pool of worker processes (defaulting to RENDER_WORKERS), each of 
+    which loads the images and caches its surfaces once. Game i is saved as
+    game_<i>_<frame>.png. Returns the number of images saved.
+    """
+    if workers == None:
+        workers = RENDER_WORKERS
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    jobs = [(columns, os.path.join(out_dir, 'game_%05d' % (game_idx)), animate) 
+            for game_idx, columns in enumerate(games)]
+    pool = multiprocessing.Pool(workers, initializer = render_init)
+    try:
+        counts = pool.map(render_game, jobs, chunksize = max(1, len(jobs) // (4 * workers)))
+    finally:
+        pool.close()
+        pool.join()
+    return sum(counts)
+
+def load_game_records(path):
+    """
+    Loads game records from a text file, one game per line as the columns
+    played in order (separated by spaces or commas).
+    """
+    with open(path) as log_file:
+        return [[int(value) for value in line.replace(',', ' ').split()] 
+                for line in log_file if line.strip()]
+
 ###############################################################################
 # 5. Create a frame
 
 # Initialize Objects
 board = GameBoard(NUM_CHIP_WIDE, NUM_CHIP_HIGH, WIN_LENGTH)
 current_gstate = GameState()
+BACKGROUND_SOLVER = BackgroundSolver()
+red_chip_outline = pygame.Rect((0, DISPLAY_HEIGHT-80), (135, 80))
+blue_chip_outline = pygame.Rect((DISPLAY_WIDTH-135, DISPLAY_HEIGHT-80), (135, 80))
 
 ###############################################################################
 # 6. Start Frame and register handlers
@@ -888,7 +2593,7 @@ def main():
     is exited
     """
     # Initiate Parameters
-    global red_chip_stack, red_chip_outline, blue_chip_stack, blue_chip_outline, stop_b, start_b
+    global red_chip_stack, blue_chip_stack, stop_b, start_b
     title = 'Connect Four'
     width = DISPLAY_WIDTH
     height = DISPLAY_HEIGHT
@@ -899,19 +2604,14 @@ def main():
     canvas = pygame.display.set_mode((width, height))
     pygame.display.set_caption(title)
     # Load Necesary Images for Canvas
+    assets = load_assets()
     #    Red Stack (Human)
-    red_chip_stack = pygame.image.load('C:/Users/sillyjacob/Documents/Python Scripts/Projects/Connect 4/data/images/chips.jpg').convert_alpha() 
-    red_chip_stack = pygame.transform.scale(red_chip_stack, (125,75))
-    red_chip_outline = pygame.Rect((0, DISPLAY_HEIGHT-80), (135, 80))
+    red_chip_stack = assets['red_chip_stack']
     #    Blue Stack (AI or Human)
-    blue_chip_stack = pygame.image.load('C:/Users/sillyjacob/Documents/Python Scripts/Projects/Connect 4/data/images/chips2.jpg').convert_alpha() 
-    blue_chip_stack = pygame.transform.scale(blue_chip_stack, (125,75))
-    blue_chip_outline = pygame.Rect((DISPLAY_WIDTH-135, DISPLAY_HEIGHT-80), (135, 80))
+    blue_chip_stack = assets['blue_chip_stack']
     #    Start/Stop Buttons
-    start_b = pygame.image.load('C:/Users/sillyjacob/Documents/Python Scripts/Projects/Connect 4/data/images/Start_Button.jpg').convert_alpha()
-    start_b = pygame.transform.scale(start_b, (100,60))
-    stop_b = pygame.image.load('C:/Users/sillyjacob/Documents/Python Scripts/Projects/Connect 4/data/images/Stop_Button.jpg').convert_alpha()
-    stop_b = pygame.transform.scale(stop_b, (100,60))
+    start_b = assets['start_b']
+    stop_b = assets['stop_b']
     # Run continous Loop checking for event handlers and updating screen
     running = True
     while running:
@@ -933,5 +2633,50 @@ def main():
 
 ###############################################################################     
 # 7. Start Game
-if __name__ == '__main__': main()
+if __name__ == '__main__':
+    if '--benchmark-playouts' in sys.argv:
+        benchmark_playouts()
+    elif '--profile' in sys.argv:
+        # --profile <position file> [<collapsed stack output>]
+        args = sys.argv[sys.argv.index('--profile') + 1:]
+        game_board, game_state = load_position(args[0])
+        if len(args) > 1:
+            profile_move(game_board, game_state, args[1])
+        else:
+            profile_move(game_board, game_state, args[0] + '.folded')
+    elif '--render' in sys.argv:
+        # --render <output directory> <game record file> [--animate]
+        args = [arg for arg in sys.argv[sys.argv.index('--render') + 1:] if arg != '--animate']
+        games = load_game_records(args[1])
+        start = time.time()
+        count = render_games(games, args[0], '--animate' in sys.argv)
+        print('%d images written in %.1f seconds' % (count, time.time() - start))
+    elif '--build-endgame' in sys.argv:
+        # --build-endgame <number of random roots>
+        # --build-endgame --games <game record file> [...]
+        # --build-endgame --positions <position file> [...]
+        args = sys.argv[sys.argv.index('--build-endgame') + 1:]
+        roots = []
+        if args and args[0].isdigit():
+            # Roots from random games which are still in progress at ENDGAME_EMPTY
+            while len(roots) < int(args[0]):
+                game_board, game_state = random_position(ENDGAME_EMPTY)
+                if game_state._winner == None:
+                    roots.append((game_board, game_state))
+        elif len(args) > 1 and args[0] == '--games':
+            # Roots where the recorded games reach ENDGAME_EMPTY
+            for path in args[1:]:
+                roots += endgame_roots(load_game_records(path))
+        elif len(args) > 1 and args[0] == '--positions':
+            # Positions with at most ENDGAME_EMPTY empty spaces are roots as they are
+            for path in args[1:]:
+                roots.append(load_position(path))
+        else:
+            print('Usage: python Connect_4_Current.py --build-endgame <number of random roots>')
+            print('       python Connect_4_Current.py --build-endgame --games <game record file> [...]')
+            print('       python Connect_4_Current.py --build-endgame --positions <position file> [...]')
+            sys.exit(2)
+        print('%d roots, %d positions stored' % (len(roots), build_endgame_db(roots)))
+    else:
+        main()
 
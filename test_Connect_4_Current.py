@@ -0,0 +1,154 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import Connect_4_Current as C
+
+
+def play_columns(columns):
+    game_board = C.GameBoard(C.NUM_CHIP_WIDE, C.NUM_CHIP_HIGH, C.WIN_LENGTH)
+    game_state = C.GameState(C.PLAYER_1)
+    game_state.start_game()
+    for column in columns:
+        game_board.quick_add([column, game_board.get_empty_slot(column)], game_state._player_turn)
+        game_board.check_win(game_state)
+        game_state.switch_turn()
+    return game_board, game_state
+
+
+# Positions with 12 empty spaces, solved by the full DFS as a forced win for
+# BLUE (trace 10) and for RED (trace 9)
+BLUE_WINS = [5, 5, 6, 6, 1, 2, 5, 5, 6, 0, 6, 2, 4, 1, 0, 3, 3, 0, 0, 1, 2, 3, 4, 3, 3, 1, 1, 2, 5, 5]
+RED_WINS = [2, 2, 4, 1, 2, 1, 6, 3, 3, 2, 0, 6, 6, 0, 5, 6, 1, 1, 3, 0, 1, 5, 6, 0, 3, 6, 5, 1, 2, 3]
+
+
+class ExactSolverTest(unittest.TestCase):
+    """
+    Checks the exact solvers against a full board_move_DFS: same score, and
+    a move which keeps that score.
+    """
+
+    def assertAgreesWithDFS(self, game_board, game_state, move):
+        expected = C.board_move_DFS(game_board, game_state, {}, False, 1)
+        self.assertIsNotNone(move)
+        self.assertEqual(move[0], expected[0])
+        child_board = game_board.clone()
+        child_state = game_state.clone()
+        child_board.quick_add(move[1], child_state._player_turn)
+        winner = child_board.check_win(child_state)
+        child_state.switch_turn()
+        if winner == None:
+            self.assertEqual(C.board_move_DFS(child_board, child_state, {}, False, 1)[0], expected[0])
+        else:
+            self.assertEqual(C.SCORES[winner], expected[0])
+
+    def test_proof_number_search(self):
+        for columns in [BLUE_WINS, RED_WINS]:
+            game_board, game_state = play_columns(columns)
+            move = C.board_move_PN(game_board, game_state, {}, 1, C.PN_NODES)
+            self.assertAgreesWithDFS(game_board, game_state, move)
+
+    @unittest.skipIf(C.shared_memory == None, 'needs multiprocessing.shared_memory')
+    def test_parallel_solver(self):
+        for columns in [BLUE_WINS, RED_WINS]:
+            game_board, game_state = play_columns(columns)
+            move = C.board_move_parallel(game_board, game_state, 2)
+            self.assertAgreesWithDFS(game_board, game_state, move)
+
+    def test_endgame_database(self):
+        positions = [play_columns(columns) for columns in [BLUE_WINS, RED_WINS]]
+        directory = tempfile.mkdtemp()
+        path, database = C.ENDGAME_DB_PATH, C.ENDGAME_DB
+        try:
+            C.ENDGAME_DB_PATH = os.path.join(directory, 'endgame.npy')
+            C.ENDGAME_DB = None
+            self.assertGreater(C.build_endgame_db(positions, 12, C.ENDGAME_DB_PATH), 0)
+            for game_board, game_state in positions:
+                move = C.board_move_endgame(game_board, game_state)
+                self.assertAgreesWithDFS(game_board, game_state, move)
+        finally:
+            C.ENDGAME_DB_PATH, C.ENDGAME_DB = path, database
+            shutil.rmtree(directory)
+
+
+class EngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.move_time = C.MOVE_TIME
+        C.MOVE_TIME = 1
+        C.random.seed(0)
+
+    def tearDown(self):
+        C.MOVE_TIME = self.move_time
+
+    def test_sessions_with_opposite_first_turns(self):
+        # RED moves first and the computer answers for BLUE, storing the
+        # positions it searched (RED to move at equal chip counts).
+        engine = C.Engine()
+        red_first = engine.new_session(C.PLAYER_1, 'Expert')
+        for column in [0, 4, 5, 3, 0, 6, 2, 1, 0, 5, 2, 6, 3, 3, 6, 6, 5, 5, 4, 0, 0, 1, 0, 4, 3]:
+            engine.play_move(red_first, column)
+        session = engine.get_session(red_first)
+        board = copy.deepcopy(session._board)
+        # The whole MOVE_TIME, so the background solver also stores positions
+        C.get_move(session._board, session._state, tables = engine.get_tables(red_first),
+                   level = 'Expert', solver = session._solver)
+        # BLUE moved first in this game, so BLUE is to move at equal chip
+        # counts, with an immediate win in column 1 or 2
+        board.quick_add([1, board.get_empty_slot(1)], C.PLAYER_2)
+        blue_first = engine.new_session(C.PLAYER_2, 'Expert')
+        engine.get_session(blue_first)._board = board
+        self.assertIn(engine.computer_move(blue_first), [1, 2])
+        self.assertEqual(engine.get_session(blue_first)._state._winner, C.PLAYER_2)
+        self.assertIsNot(engine.get_tables(red_first), engine.get_tables(blue_first))
+
+    def test_play_move_rejects_columns_off_the_board(self):
+        engine = C.Engine()
+        session_id = engine.new_session()
+        for column in [-1, C.NUM_CHIP_WIDE]:
+            self.assertRaises(ValueError, engine.play_move, session_id, column)
+        self.assertEqual(engine.get_session(session_id)._board.get_state_indices(C.PLAYER_1), [])
+
+
+class LevelTest(unittest.TestCase):
+
+    def test_level_move_only_depends_on_position(self):
+        game_board, game_state = play_columns([3, 3, 2, 4, 4, 2, 5, 1, 1, 0, 6])
+        random_state = C.random.getstate()
+        first_move = C.get_level_move(game_board, game_state, 'Hard')
+        # Another game in between, as with warmed dictionaries
+        other_board, other_state = play_columns([0, 1, 2, 3, 3, 2, 1, 0, 6])
+        C.get_level_move(other_board, other_state, 'Hard')
+        self.assertEqual(C.get_level_move(game_board, game_state, 'Hard'), first_move)
+        self.assertEqual(C.random.getstate(), random_state)
+
+
+
+class BackgroundSolverTest(unittest.TestCase):
+
+    def test_hits_only_count_positions_the_solver_finished(self):
+        game_board, game_state = play_columns(BLUE_WINS)
+        move = C.board_move_eval(game_board, game_state, 1)
+        reply_board, reply_state = play_columns(BLUE_WINS + [move[1][0]])
+        reply = C.board_move_eval(reply_board, reply_state, 1)
+        reply_board, reply_state = play_columns(BLUE_WINS + [move[1][0], reply[1][0]])
+        # Predicted, but stored by another search
+        solver = C.BackgroundSolver()
+        solver.schedule(game_board, game_state, move, 1)
+        grid = {}
+        C.board_move_DFS(reply_board, reply_state, grid, True, 1)
+        self.assertIsNotNone(solver.lookup(reply_board, reply_state, grid))
+        self.assertEqual(solver.get_stats()['hits'], 0)
+        # Predicted and solved by the solver
+        solver = C.BackgroundSolver()
+        solver.schedule(game_board, game_state, move, 1)
+        grid = {}
+        self.assertTrue(solver.solve_queue(grid, C.SearchBudget()))
+        self.assertIsNotNone(solver.lookup(reply_board, reply_state, grid))
+        self.assertEqual(solver.get_stats()['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()